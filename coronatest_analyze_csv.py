@@ -5,9 +5,12 @@
 Created on Sat Feb 12 22:15:29 2022  // @hk_nien
 """
 from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+from collections import deque
 import os
 import re
 import sys
+import time
 import pandas as pd
 import numpy as np
 
@@ -101,7 +104,7 @@ def _summary_to_scores(summary):
             if pc4 in multi_pcs:
                 pc4_key = multi_pcs[pc4]
             else:
-                print(f'{pc4} not in list...')
+                print(f'{pc4} not in list...', file=sys.stderr)
                 continue
         else:
             pc4_key = pc4
@@ -263,7 +266,8 @@ def get_scan_scores_df(df, tm_ranges, decimal_comma=True):
                 is_ok = False
                 break
         if not is_ok:
-            print(f'Dropped scan at {tm_ra[0].strftime("%Y-%m-%d %H:%M")}')
+            print(f'Dropped scan at {tm_ra[0].strftime("%Y-%m-%d %H:%M")}',
+                  file=sys.stderr)
             continue
         tm, scores, minwait, medwait = get_scan_scores(df, tm_ra)
         records.append(scores)
@@ -287,35 +291,109 @@ def get_scan_scores_df(df, tm_ranges, decimal_comma=True):
         for c in sdf.columns[2:]:
             sdf[c] = sdf[c].astype(str)
             sdf[c] = sdf[c].str.replace('.', ',', regex=False)
-            sdf[c] = sdf[c].str.replace(',0$', '', regex=False)
+            sdf[c] = sdf[c].str.replace(',0$', '', regex=True)
             sdf[c] = sdf[c].str.replace('?', '', regex=False)
 
     return sdf
 
+def _load_and_score_csv(csv_fname):
+    """Return scores DataFrame for one CSV file (runs in worker process)."""
+    df, start_tms = load_csv(csv_fname)
+    return get_scan_scores_df(df, start_tms)
+
+
+def iter_scan_scores_dfs(csv_fnames, max_workers=None, max_pending=None):
+    """Yield scores DataFrame per CSV file, in order of csv_fnames.
+
+    Files are loaded and scored in a process pool; the first results are
+    yielded while later files are still being processed.
+
+    Parameters:
+
+    - csv_fnames: list of CSV filenames.
+    - max_workers: number of worker processes (default: number of CPUs).
+    - max_pending: maximum number of files submitted but not yet yielded
+      (default: 2*max_workers).
+    """
+    max_workers = max_workers or os.cpu_count() or 1
+    max_pending = max_pending or 2*max_workers
+    fnames = iter(csv_fnames)
+    with ProcessPoolExecutor(max_workers) as pool:
+        pending = deque()
+        for fname in fnames:
+            pending.append(pool.submit(_load_and_score_csv, fname))
+            if len(pending) == max_pending:
+                break
+        while pending:
+            sdf = pending.popleft().result()
+            fname = next(fnames, None)
+            if fname is not None:
+                pending.append(pool.submit(_load_and_score_csv, fname))
+            yield sdf
+
+
+def write_scan_scores(csv_fnames, f=sys.stdout, **kwargs):
+    """Write scores for CSV files as tab-separated data, oldest first.
+
+    Output for each file is written (and flushed) as soon as it is
+    available. Keyword arguments are passed to iter_scan_scores_dfs().
+
+    Return list of scores DataFrames.
+    """
+    sdfs = []
+    for sdf in iter_scan_scores_dfs(csv_fnames, **kwargs):
+        sdf.to_csv(f, sep='\t', index=False, header=(len(sdfs) == 0))
+        f.flush()
+        sdfs.append(sdf)
+    return sdfs
+
+
+def benchmark_pipeline(csv_fnames, max_workers=None):
+    """Print end-to-end timing of sequential vs. pipelined processing."""
+    tm_start = time.perf_counter()
+    df, start_tms = load_multi_csvs(csv_fnames)
+    get_scan_scores_df(df, start_tms)
+    t_seq = time.perf_counter() - tm_start
+
+    tm_start = time.perf_counter()
+    with open(os.devnull, 'w') as f:
+        write_scan_scores(csv_fnames, f, max_workers=max_workers)
+    t_pipe = time.perf_counter() - tm_start
+
+    print(
+        f'{len(csv_fnames)} files; sequential: {t_seq:.2f} s; '
+        f'pipelined: {t_pipe:.2f} s; speedup: {t_seq/t_pipe:.2f}x.'
+        )
+
 
 if __name__ == '__main__':
 
     in_spyder = ('SPYDER_ARGS' in os.environ)
     csv_fnames = sorted(Path('data-ggd').glob('ggd_scan-????-W??.csv'))
+    jobs = [int(a[7:]) for a in sys.argv if a.startswith('--jobs=')]
+    jobs = jobs[-1] if jobs else None
+    if '--bench' in sys.argv:
+        benchmark_pipeline(csv_fnames, max_workers=jobs)
+        sys.exit(0)
     do_all = ('--all' in sys.argv)
     do_all = do_all or in_spyder and input('(A)ll or latest?').lower() == 'a'
+    do_clip = ('--clip' in sys.argv) or in_spyder
     if do_all:
-        df, start_tms = load_multi_csvs(csv_fnames)
-        sdf = get_scan_scores_df(df, start_tms).iloc[::-1]
+        sdfs = write_scan_scores(csv_fnames, max_workers=jobs)
+        sdf = pd.concat(sdfs).iloc[::-1]
     else:
         df, start_tms = load_csv(csv_fnames[-1])
         sdf = get_scan_scores_df(df, start_tms[-2:])
-    print(sdf)
-    if len(sdf) > 1:
+        print(sdf)
+    if len(sdf) == 0:
+        print('No output.')
+    elif do_clip and len(sdf) > 1:
         sdf.to_clipboard(index=False)
         print('Copied to clipboard including headers')
-    elif len(sdf) == 1:
+    elif do_clip:
         sdf.iloc[[0], 2:].to_clipboard(header=False, index=False)
         print('Copied to clipboard, scores only.')
-    else:
-        print('No output.')
 
-    if not in_spyder:
+    if do_clip and not in_spyder:
         # Note: in Spyder, copy/paste will stall while input is blocked.
         input('Press Enter to quit and clear clipboard.')
-
@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Booking-rate time series per SON location. You can run this as a script.
+
+The booking numbers (num_booked*/num_slots*) of all scans are collected
+into location x scan arrays, for all booking categories at once. Rolling
+and resampled (hourly, daily, per weekday) aggregations are calculated
+from cumulative sums along the scan axis, so that new scans can be
+appended without recalculating the older data.
+
+Note: for api_version 2 (from 10 February), num_booked is the number of
+fully booked time slots rather than the number of bookings.
+
+Copyright Han-Kwang Nienhuys (2022) - Twitter: @hk_nien
+License: MIT.
+"""
+from pathlib import Path
+import pandas as pd
+import numpy as np
+from son_analyze import get_csv_as_dataframe
+
+# booking categories (name suffix); same order as the array axis 0.
+BOOK_CATS = ('', '_2h', '_45m', '_15m')
+
+# Maximum gap between rows of the same scan.
+SCAN_GAP = pd.Timedelta('15min')
+
+
+class BookingRates:
+    """Booked/available slots per location and scan, with aggregations.
+
+    Attributes:
+
+    - locs: list of location names (short_addr); index of axis 1.
+    - scan_tms: array (datetime64) of scan start times; index of axis 2.
+    - booked, slots: int arrays, shape (ncat, nloc, nscan) with ncat
+      corresponding to BOOK_CATS. Only the earliest appointment date of
+      each scan is used.
+
+    Usage:
+
+    - br = BookingRates(df) with df from son_analyze.get_csv_as_dataframe().
+    - br.update(df_new) to append newer scans.
+    - br.get_rates(), br.rolling('6h'), br.resample('1d'), br.by_weekday()
+      for DataFrames with booking rates (location x time).
+    """
+
+    def __init__(self, df=None):
+        self.locs = []
+        self._loc_idx = {}  # location name -> index in self.locs
+        self.scan_tms = np.array([], dtype='datetime64[ns]')
+        self._last_tm = None  # most recent scan_time in the data
+        ncat = len(BOOK_CATS)
+        self.booked = np.zeros((ncat, 0, 0), dtype=np.int64)
+        self.slots = np.zeros((ncat, 0, 0), dtype=np.int64)
+        # cumulative sums along the scan axis, with leading zeros.
+        self._csum_booked = np.zeros((ncat, 0, 1), dtype=np.int64)
+        self._csum_slots = np.zeros((ncat, 0, 1), dtype=np.int64)
+        if df is not None:
+            self.update(df)
+
+    def update(self, df):
+        """Append scans from DataFrame.
+
+        All scan_time values in df must be later than the scans that were
+        already loaded; the first row in df always starts a new scan.
+        """
+        if len(df) == 0:
+            return
+        df = df.drop_duplicates().sort_values('scan_time', kind='stable')
+        if self._last_tm is not None and df['scan_time'].iloc[0] <= self._last_tm:
+            raise ValueError(
+                f'update: scan_time {df["scan_time"].iloc[0]} is not after '
+                f'{self._last_tm}.'
+                )
+        self._last_tm = df['scan_time'].iloc[-1]
+
+        # Scan index of each row (relative to this update).
+        stms = df['scan_time'].values
+        is_start = np.concatenate([[True], np.diff(stms) > SCAN_GAP.to_timedelta64()])
+        iscans = np.cumsum(is_start) - 1
+        new_scan_tms = stms[is_start]
+        nscan_new = len(new_scan_tms)
+
+        # Keep only the earliest appointment date per scan; this also drops
+        # the dummy rows (no apt_date) for scans without data.
+        apt_dates = df['apt_date'].values
+        first_apt = pd.Series(apt_dates).groupby(iscans).transform('min').values
+        mask = (apt_dates == first_apt) & df['short_addr'].notna().values
+        iscans = iscans[mask]
+        loc_names = df['short_addr'].values[mask]
+
+        # Location indices; new locations are appended.
+        for name in pd.unique(loc_names):
+            if name not in self._loc_idx:
+                self._loc_idx[name] = len(self.locs)
+                self.locs.append(name)
+        ilocs = np.array([self._loc_idx[name] for name in loc_names], dtype=int)
+
+        ncat, nloc = len(BOOK_CATS), len(self.locs)
+        booked = np.zeros((ncat, nloc, nscan_new), dtype=np.int64)
+        slots = np.zeros_like(booked)
+        vals_b = df.loc[mask, [f'num_booked{s}' for s in BOOK_CATS]].values.T
+        vals_s = df.loc[mask, [f'num_slots{s}' for s in BOOK_CATS]].values.T
+        np.add.at(booked, (slice(None), ilocs, iscans), vals_b)
+        np.add.at(slots, (slice(None), ilocs, iscans), vals_s)
+
+        self.booked = np.concatenate([self._pad_locs(self.booked), booked], axis=2)
+        self.slots = np.concatenate([self._pad_locs(self.slots), slots], axis=2)
+        self._csum_booked = self._append_csum(self._csum_booked, booked)
+        self._csum_slots = self._append_csum(self._csum_slots, slots)
+        self.scan_tms = np.concatenate([self.scan_tms, new_scan_tms])
+
+    def _pad_locs(self, arr):
+        """Return array with zero rows added for new locations (axis 1)."""
+        npad = len(self.locs) - arr.shape[1]
+        return np.pad(arr, ((0, 0), (0, npad), (0, 0)))
+
+    def _append_csum(self, csum, arr):
+        """Return cumulative-sum array extended with new scans in arr."""
+        csum = self._pad_locs(csum)
+        csum_new = csum[:, :, -1:] + np.cumsum(arr, axis=2)
+        return np.concatenate([csum, csum_new], axis=2)
+
+    def _window_sums(self, i0, i1):
+        """Return booked, slots sums over scan ranges [i0, i1).
+
+        Arrays have shape (ncat, nloc, len(i0)).
+        """
+        b = self._csum_booked[:, :, i1] - self._csum_booked[:, :, i0]
+        s = self._csum_slots[:, :, i1] - self._csum_slots[:, :, i0]
+        return b, s
+
+    def _rates_df(self, b, s, cat, columns, total):
+        """Return DataFrame (location x columns) with booking rates."""
+        icat = BOOK_CATS.index(cat)
+        b, s = b[icat], s[icat]
+        index = list(self.locs)
+        if total:
+            b = np.vstack([b, b.sum(axis=0)])
+            s = np.vstack([s, s.sum(axis=0)])
+            index.append('Totaal')
+        with np.errstate(invalid='ignore', divide='ignore'):
+            rates = np.where(s > 0, b / s, np.nan)
+        return pd.DataFrame(rates, index=index, columns=columns)
+
+    def get_rates(self, cat='', total=False):
+        """Return DataFrame with booking rate per location (rows) and scan.
+
+        Parameters:
+
+        - cat: booking category, one of BOOK_CATS.
+        - total: True to add a row 'Totaal' for all locations combined.
+
+        Rates are NaN if there were no slots.
+        """
+        i1 = np.arange(1, len(self.scan_tms)+1)
+        b, s = self._window_sums(i1-1, i1)
+        return self._rates_df(b, s, cat, pd.DatetimeIndex(self.scan_tms), total)
+
+    def rolling(self, window='6h', cat='', total=False):
+        """Return DataFrame with rolling booking rates, one column per scan.
+
+        Parameters:
+
+        - window: time window (Timedelta or str); includes scans with
+          tm - window < scan_time <= tm.
+        - cat, total: see get_rates().
+
+        Rates are sum(booked)/sum(slots) over the window.
+        """
+        window = pd.Timedelta(window).to_timedelta64()
+        i1 = np.arange(1, len(self.scan_tms)+1)
+        i0 = np.searchsorted(self.scan_tms, self.scan_tms - window, side='right')
+        b, s = self._window_sums(i0, i1)
+        return self._rates_df(b, s, cat, pd.DatetimeIndex(self.scan_tms), total)
+
+    def _resample_sums(self, freq):
+        """Return bin start times, booked, slots sums per time bin."""
+        freq = pd.Timedelta(freq)
+        tbins = pd.DatetimeIndex(self.scan_tms).floor(freq).unique()
+        i0 = np.searchsorted(self.scan_tms, tbins.values, side='left')
+        i1 = np.searchsorted(self.scan_tms, (tbins + freq).values, side='left')
+        b, s = self._window_sums(i0, i1)
+        return tbins, b, s
+
+    def resample(self, freq='1d', cat='', total=False):
+        """Return DataFrame with booking rates per time bin.
+
+        Parameters:
+
+        - freq: bin size (Timedelta or str), e.g. '1h' or '1d'.
+        - cat, total: see get_rates().
+
+        Only bins that contain at least one scan are included.
+        """
+        tbins, b, s = self._resample_sums(freq)
+        return self._rates_df(b, s, cat, tbins, total)
+
+    def by_weekday(self, cat='', total=False):
+        """Return DataFrame with booking rates per weekday (0=Monday).
+
+        Parameters: see get_rates().
+        """
+        tbins, b_day, s_day = self._resample_sums('1d')
+        wdays = tbins.weekday.values
+        shape = b_day.shape[:2] + (7,)
+        b, s = np.zeros(shape, dtype=np.int64), np.zeros(shape, dtype=np.int64)
+        np.add.at(b, (slice(None), slice(None), wdays), b_day)
+        np.add.at(s, (slice(None), slice(None), wdays), s_day)
+        return self._rates_df(b, s, cat, pd.RangeIndex(7, name='weekday'), total)
+
+
+def load_booking_rates(yearweeks=None):
+    """Return BookingRates from data-son/son_scan-*.csv files.
+
+    - yearweeks: optional list of 'yyyy-Www' strings; default all files.
+    """
+    if yearweeks is None:
+        flist = sorted(Path('data-son').glob('son_scan-20??-W??.csv'))
+    else:
+        flist = [Path('data-son') / f'son_scan-{yw}.csv' for yw in yearweeks]
+    if len(flist) == 0:
+        raise FileNotFoundError('data-son/son_scan-20??-W??.csv')
+    df, _ = get_csv_as_dataframe(flist)
+    return BookingRates(df)
+
+
+if __name__ == '__main__':
+    brates = load_booking_rates()
+    with pd.option_context('display.width', 120, 'display.max_columns', 20):
+        print(brates.resample('1d', total=True).round(3).T)
+        print(brates.by_weekday(cat='_2h', total=True).round(3).T)